@@ -1,6 +1,5 @@
 from sqlmodel import SQLModel, create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from contextlib import asynccontextmanager
 
 from app.config import get_settings
@@ -15,7 +14,7 @@ async_engine = create_async_engine(
 )
 
 # Async session factory
-async_session_maker = sessionmaker(
+async_session_maker = async_sessionmaker(
     async_engine,
     class_=AsyncSession,
     expire_on_commit=False,
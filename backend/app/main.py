@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -7,13 +8,20 @@ from pathlib import Path
 from app.routers import audio, auth, sync, asr, drill, lesson
 from app.database import init_db
 from app.config import get_settings
+from app.services.lesson import get_lesson_service
+from app.services.state_persistence import state_writer
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup."""
-    await init_db()
+    """Initialize database and services on startup."""
+    # Build the singletons (and load words) before serving, so the first
+    # requests neither pay for it nor race to construct them. The word
+    # loading runs in a thread so it overlaps the database setup.
+    await asyncio.gather(init_db(), asyncio.to_thread(get_lesson_service))
     yield
+    # Write out state saves still queued by answer handlers
+    await state_writer.close()
 
 
 app = FastAPI(
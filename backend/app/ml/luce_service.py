@@ -51,9 +51,7 @@ class LuceState(ConfusionState):
 
     def copy_with_increment(self, played: int, selected: int) -> "LuceState":
         """Return new state with incremented count. 1-indexed inputs."""
-        new_counts = [row.copy() for row in self.counts]
-        new_counts[played - 1][selected - 1] += 1.0
-        return LuceState(n_classes=self.n_classes, counts=new_counts, prior=self.prior)
+        return self.model_copy(update={"counts": self._incremented_counts(played, selected)})
 
 
 class LuceMLService:
@@ -97,30 +95,61 @@ class LuceMLService:
         """
         # Handle both LuceState and ConfusionState
         prior = getattr(state, "prior", self.prior)
+        row = state.counts[problem.correct_sequence[0] - 1]
+        return self._success_distribution(problem, row, sum(row), prior)
 
+    def batch_success_distribution(
+        self,
+        problems: list[Problem],
+        state: ConfusionState,
+    ) -> list[BetaParams]:
+        """Get Beta distributions for multiple problems.
+
+        Observation totals per played class are computed once for the batch.
+        """
+        prior = getattr(state, "prior", self.prior)
+        counts = state.counts
+        n_obs = [sum(row) for row in counts]
+        results = []
+        for problem in problems:
+            played = problem.correct_sequence[0] - 1
+            results.append(
+                self._success_distribution(problem, counts[played], n_obs[played], prior)
+            )
+        return results
+
+    def _success_distribution(
+        self,
+        problem: Problem,
+        row: list[float],
+        n_obs: float,
+        prior: float,
+    ) -> BetaParams:
+        """Luce success distribution given the played class's count row.
+
+        n_obs is the total observations for the played class (sum of row).
+        """
         # Get the class being tested (first syllable)
         correct_class = problem.correct_sequence[0]
         # alternatives already includes the correct answer
-        alt_classes = [alt[0] for alt in problem.alternatives]
+        alternatives = problem.alternatives
 
-        # Compute strengths (counts + prior)
-        strengths = []
+        # Sum strengths (counts + prior) over the alternatives' first classes
+        total_strength = 0
         correct_strength = None
-        for c in alt_classes:
-            count = state.counts[correct_class - 1][c - 1]
-            strength = count + prior
-            strengths.append(strength)
+        for alt in alternatives:
+            c = alt[0]
+            strength = row[c - 1] + prior
+            total_strength += strength
             if c == correct_class:
                 correct_strength = strength
 
         # Luce choice probability
-        total_strength = sum(strengths)
         p_correct = correct_strength / total_strength if correct_strength else 0.25
 
         # Effective N based on observations for this played class
         # prior_n = number of alternatives * prior (initial pseudocounts)
-        n_obs = sum(state.counts[correct_class - 1])
-        prior_n = len(alt_classes) * prior
+        prior_n = len(alternatives) * prior
         effective_n = prior_n + n_obs
 
         alpha = p_correct * effective_n
@@ -128,14 +157,6 @@ class LuceMLService:
 
         return BetaParams(alpha=alpha, beta=beta)
 
-    def batch_success_distribution(
-        self,
-        problems: list[Problem],
-        state: ConfusionState,
-    ) -> list[BetaParams]:
-        """Get Beta distributions for multiple problems."""
-        return [self.get_success_distribution(p, state) for p in problems]
-
     def update_state(
         self,
         state: ConfusionState,
@@ -206,66 +227,57 @@ class LuceMLService:
     ) -> dict[tuple[int, int], BetaParams]:
         """Get Beta parameters for all pairs of classes.
 
-        Creates synthetic 2-choice problems for each pair and uses
-        batch_success_distribution to compute stats consistently.
+        For each pair (i, j), computes the get_success_distribution of the
+        2-choice problem in both directions directly from the count rows,
+        then combines them with a moment-matched Beta mixture.
+
+        The result is memoized on the state until its counts change, so
+        the returned dict is shared and must not be mutated.
         """
-        config = get_problem_type(problem_type_id)
-        n = config.n_classes
+        prior = getattr(state, "prior", self.prior)
+        return state.derived(
+            ("luce_pair_stats", prior),
+            lambda: self._compute_pair_stats(state, prior),
+        )
 
-        # Create synthetic problems for each pair (both directions)
-        problems: list[Problem] = []
-        pair_indices: list[tuple[int, int, str]] = []
+    def _compute_pair_stats(
+        self,
+        state: ConfusionState,
+        prior: float,
+    ) -> dict[tuple[int, int], BetaParams]:
+        """Uncached get_all_pair_stats."""
+        from .beta_utils import beta_mixture_approx
 
-        for i in range(n):
-            for j in range(i + 1, n):
-                # Problem where class i+1 is correct, choosing between i+1 and j+1
-                problems.append(
-                    Problem(
-                        problem_type_id=problem_type_id,
-                        word_id=0,  # Synthetic
-                        vietnamese="",
-                        correct_index=0,
-                        correct_sequence=[i + 1],  # 1-indexed
-                        alternatives=[[i + 1], [j + 1]],  # Both options
-                    )
-                )
-                pair_indices.append((i + 1, j + 1, "i"))
-
-                # Problem where class j+1 is correct, choosing between i+1 and j+1
-                problems.append(
-                    Problem(
-                        problem_type_id=problem_type_id,
-                        word_id=0,
-                        vietnamese="",
-                        correct_index=0,
-                        correct_sequence=[j + 1],
-                        alternatives=[[i + 1], [j + 1]],  # Both options
-                    )
-                )
-                pair_indices.append((i + 1, j + 1, "j"))
+        counts = state.counts
+        n = len(counts)
 
-        # Get all success distributions in one batch
-        betas = self.batch_success_distribution(problems, state)
+        # Effective N per played class: 2-choice prior pseudocounts + observations
+        effective_n = [2 * prior + sum(row) for row in counts]
 
-        # Use moment-matched Beta mixture for each pair
-        from .beta_utils import beta_mixture_approx
+        def direction(played: int, other: int) -> tuple[float, float]:
+            row = counts[played]
+            correct_strength = row[played] + prior
+            total_strength = correct_strength + (row[other] + prior)
+            p_correct = correct_strength / total_strength if correct_strength else 0.25
+            eff = effective_n[played]
+            return p_correct * eff, (1 - p_correct) * eff
 
         result = {}
-        for idx in range(0, len(betas), 2):
-            beta_i = betas[idx]  # i is correct
-            beta_j = betas[idx + 1]  # j is correct
-            i, j, _ = pair_indices[idx]
-
-            # Compute moment-matched mixture of the two directions
-            mix_alpha, mix_beta = beta_mixture_approx(
-                beta_i.alpha,
-                beta_i.beta,
-                beta_j.alpha,
-                beta_j.beta,
-                w1=0.5,  # Equal weight for both directions
-            )
+        for i in range(n):
+            for j in range(i + 1, n):
+                alpha_i, beta_i = direction(i, j)  # i is correct
+                alpha_j, beta_j = direction(j, i)  # j is correct
 
-            result[(i, j)] = BetaParams(alpha=mix_alpha, beta=mix_beta)
+                # Compute moment-matched mixture of the two directions
+                mix_alpha, mix_beta = beta_mixture_approx(
+                    alpha_i,
+                    beta_i,
+                    alpha_j,
+                    beta_j,
+                    w1=0.5,  # Equal weight for both directions
+                )
+
+                result[(i + 1, j + 1)] = BetaParams(alpha=mix_alpha, beta=mix_beta)
 
         return result
 
@@ -320,14 +332,10 @@ class BradleyTerryState(ConfusionState):
             played: The correct/played class (1-indexed)
             selected: The class user selected (1-indexed)
         """
-        new_counts = [row.copy() for row in self.counts]
-        new_counts[played - 1][selected - 1] += 1.0
-        return BradleyTerryState(
-            n_classes=self.n_classes,
-            counts=new_counts,
-            prior=self.prior,
-            model_version=3,
-        )
+        return self.model_copy(update={
+            "counts": self._incremented_counts(played, selected),
+            "model_version": 3,
+        })
 
 
 class BradleyTerryMLService:
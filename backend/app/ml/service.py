@@ -82,7 +82,7 @@ class ConfusionMLService:
         we use the first syllable as primary (can be extended later).
         """
         config = get_problem_type(problem.problem_type_id)
-        counts = np.array(state.counts)
+        counts = state.counts_array()
 
         # Get the class being tested (first syllable for now)
         # TODO: Extend to handle multi-syllable properly
@@ -161,7 +161,7 @@ class ConfusionMLService:
         Returns P(selected=j | played=i) for all classes j.
         Classes are 1-indexed.
         """
-        counts = np.array(state.counts)
+        counts = state.counts_array()
         row = counts[played_class - 1]  # Convert to 0-indexed
         probs = row / row.sum()
 
@@ -180,7 +180,7 @@ class ConfusionMLService:
         """
         config = get_problem_type(problem_type_id)
         n = config.n_classes
-        counts = np.array(state.counts)
+        counts = state.counts_array()
         result = {}
 
         for i in range(n):
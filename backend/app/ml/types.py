@@ -3,8 +3,10 @@
 These models define the interface between the main logic layer and ML layer.
 """
 
-from typing import Any, Literal
-from pydantic import BaseModel, Field
+from typing import Any, Callable, Hashable, Literal, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class Problem(BaseModel):
@@ -67,15 +69,67 @@ class ConfusionState(BaseModel):
 
     model_config = {"arbitrary_types_allowed": True}
 
+    # Read-only ndarray view of counts, rebuilt if counts is replaced
+    _array: Optional[np.ndarray] = PrivateAttr(default=None)
+    _array_source: Optional[list] = PrivateAttr(default=None)
+    # Memoized derived values (pair stats etc.), keyed like _array
+    _derived: dict = PrivateAttr(default_factory=dict)
+    _derived_source: Optional[list] = PrivateAttr(default=None)
+
+    def __eq__(self, other: object) -> bool:
+        """Compare model fields only, leaving the private caches out.
+
+        Pydantic's default also compares private attributes, which would
+        make equality depend on what has been cached (and fail outright on
+        the ndarray).
+        """
+        if not isinstance(other, BaseModel):
+            return NotImplemented
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
+    def counts_array(self) -> np.ndarray:
+        """Get counts as a float ndarray, cached on the state (do not mutate)."""
+        if self._array is None or self._array_source is not self.counts:
+            array = np.array(self.counts, dtype=float)
+            array.flags.writeable = False
+            self._array = array
+            self._array_source = self.counts
+        return self._array
+
+    def derived(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Memoize a value derived from counts, cached on the state (do not mutate).
+
+        Like counts_array, the cache is dropped as soon as counts is replaced,
+        so model_copy'd states never see their parent's values. It does not
+        take part in equality (see __eq__).
+        """
+        if self._derived_source is not self.counts:
+            self._derived = {}
+            self._derived_source = self.counts
+        if key not in self._derived:
+            self._derived[key] = compute()
+        return self._derived[key]
+
     def get_count(self, played: int, selected: int) -> float:
         """Get count for (played, selected) pair. 1-indexed inputs."""
         return self.counts[played - 1][selected - 1]
 
     def copy_with_increment(self, played: int, selected: int) -> "ConfusionState":
         """Return new state with incremented count. 1-indexed inputs."""
-        new_counts = [row.copy() for row in self.counts]
-        new_counts[played - 1][selected - 1] += 1.0
-        return ConfusionState(n_classes=self.n_classes, counts=new_counts)
+        return self.model_copy(update={"counts": self._incremented_counts(played, selected)})
+
+    def _incremented_counts(self, played: int, selected: int) -> list[list[float]]:
+        """Counts with one cell incremented, copying only the changed row.
+
+        The other rows are shared with this state. That is safe because
+        states are never mutated in place (updates go through
+        copy_with_increment), so a shallow model_copy can reuse the
+        already-validated rows instead of re-validating the whole matrix.
+        """
+        new_counts = list(self.counts)
+        row = new_counts[played - 1] = new_counts[played - 1].copy()
+        row[selected - 1] += 1.0
+        return new_counts
 
 
 class BetaParams(BaseModel):
@@ -1,8 +1,28 @@
 from sqlmodel import SQLModel, Field, JSON, Column, UniqueConstraint
+from sqlalchemy.types import TypeDecorator
 from datetime import datetime
 from typing import Optional
 import uuid
 
+import orjson
+
+
+class StateJSON(TypeDecorator):
+    """JSON column encoded with orjson.
+
+    ML states are rewritten on every answer and orjson encodes their count
+    matrices several times faster than stdlib json. Other JSON columns
+    (e.g. user-synced card_data) keep stdlib json, which also accepts NaN
+    and ints beyond 64 bits. Reads use the dialect's usual decoding.
+    """
+    impl = JSON
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return orjson.dumps(value).decode()
+        return process
+
 
 class UserWordCard(SQLModel, table=True):
     """FSRS card state for a word, per user."""
@@ -83,7 +103,7 @@ class UserState(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     user_id: str = Field(foreign_key="users.id", index=True)
     problem_type_id: str = Field(index=True)  # e.g., "tone_1", "tone_2", "vowel_1"
-    state_json: dict = Field(default={}, sa_column=Column(JSON))
+    state_json: dict = Field(default={}, sa_column=Column(StateJSON))
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Config:
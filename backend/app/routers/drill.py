@@ -24,11 +24,10 @@ from app.ml import (
     StateUpdate,
     ConfusionState,
     BetaParams,
-    make_problem_type_id,
     get_problem_types_for_drill,
 )
-from app.services.drill import get_drill_service, DifficultyLevel
-from app.services.state_persistence import load_state, save_state, load_all_states
+from app.services.drill import get_drill_service, DifficultyLevel, TONE_1_PTID
+from app.services.state_persistence import load_state, load_states, queue_state, load_all_states
 
 router = APIRouter()
 
@@ -169,12 +168,9 @@ async def get_next_drill(
 
     # Load all states for this drill type
     problem_types = get_problem_types_for_drill("tone")
-    states: dict[str, ConfusionState] = {}
-
-    for pt in problem_types:
-        states[pt.problem_type_id] = await load_state(
-            session, current_user.id, pt.problem_type_id
-        )
+    states: dict[str, ConfusionState] = await load_states(
+        session, current_user.id, [pt.problem_type_id for pt in problem_types]
+    )
 
     # Convert request to Problem/Answer if previous answer provided
     previous_problem: Optional[Problem] = None
@@ -220,13 +216,13 @@ async def get_next_drill(
         states,
     )
 
-    # Save updated states
+    # Queue updated states to be saved in the background
     for problem_type_id, state in updated_states.items():
         if problem_type_id in [pt.problem_type_id for pt in problem_types]:
-            await save_state(session, current_user.id, problem_type_id, state)
+            queue_state(current_user.id, problem_type_id, state)
 
     # Get pair stats for the primary problem type (single syllable)
-    primary_type_id = make_problem_type_id("tone", 1)
+    primary_type_id = TONE_1_PTID
     primary_state = updated_states.get(primary_type_id)
     if primary_state is None:
         primary_state = await load_state(session, current_user.id, primary_type_id)
@@ -292,7 +288,7 @@ async def get_drill_stats(
     session: AsyncSession = Depends(get_session),
 ) -> dict:
     """Get current stats for tone drill."""
-    primary_type_id = make_problem_type_id("tone", 1)
+    primary_type_id = TONE_1_PTID
     state = await load_state(session, current_user.id, primary_type_id)
 
     from app.ml import get_ml_service
@@ -26,7 +26,7 @@ from app.services.lesson import (
     DrillMode,
     LESSON_THEMES,
 )
-from app.services.state_persistence import load_state, save_state
+from app.services.state_persistence import load_states, queue_state
 from app.routers.drill import random_voice_speed, log_attempt
 
 router = APIRouter()
@@ -110,23 +110,16 @@ async def start_lesson(
     """Start a new lesson session."""
     service = get_lesson_service()
 
-    # Load ML states for adaptive selection
-    problem_types = get_problem_types_for_drill("tone")
-    states: dict[str, ConfusionState] = {}
-    for pt in problem_types:
-        states[pt.problem_type_id] = await load_state(
-            session, current_user.id, pt.problem_type_id
-        )
-
     # Generate unique session ID
     session_id = f"{current_user.id}_{uuid.uuid4().hex[:8]}"
 
-    lesson_state = await service.start_lesson(
+    # Loads ML states for adaptive selection together with the lesson ID
+    lesson_state = await service.start_lesson_with_states(
         session_id=session_id,
         user_id=current_user.id,
         db_session=session,
+        problem_type_ids=[pt.problem_type_id for pt in get_problem_types_for_drill("tone")],
         theme_id=request.theme_id,
-        states=states,
     )
 
     return StartLessonResponse(
@@ -149,11 +142,9 @@ async def get_first_drill(
 
     # Load ML states
     problem_types = get_problem_types_for_drill("tone")
-    states: dict[str, ConfusionState] = {}
-    for pt in problem_types:
-        states[pt.problem_type_id] = await load_state(
-            session, current_user.id, pt.problem_type_id
-        )
+    states: dict[str, ConfusionState] = await load_states(
+        session, current_user.id, [pt.problem_type_id for pt in problem_types]
+    )
 
     result = service.get_next_drill(session_id, states)
 
@@ -195,11 +186,9 @@ async def get_lesson_next(
 
     # Load ML states
     problem_types = get_problem_types_for_drill("tone")
-    states: dict[str, ConfusionState] = {}
-    for pt in problem_types:
-        states[pt.problem_type_id] = await load_state(
-            session, current_user.id, pt.problem_type_id
-        )
+    states: dict[str, ConfusionState] = await load_states(
+        session, current_user.id, [pt.problem_type_id for pt in problem_types]
+    )
 
     # Determine problem_type_id from correct_sequence length
     syllable_count = len(request.correct_sequence)
@@ -245,7 +234,7 @@ async def get_lesson_next(
         )
         new_state, _ = ml.update_state(state, problem, answer)
         states[problem_type_id] = new_state
-        await save_state(session, current_user.id, problem_type_id, new_state)
+        queue_state(current_user.id, problem_type_id, new_state)
 
     # Record answer in lesson state
     problem = Problem(
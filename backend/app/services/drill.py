@@ -6,12 +6,16 @@ Uses the ML layer for all probability calculations and state updates.
 
 from __future__ import annotations
 
-import json
+import bisect
+import functools
+import itertools
 import random
+import re
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Literal
 
-from pydantic import BaseModel
+import orjson
 
 from app.ml import (
     Problem,
@@ -53,12 +57,51 @@ TONE_MARKS = {
     'ặ': 6, 'ậ': 6, 'ệ': 6, 'ộ': 6, 'ợ': 6, 'ự': 6,
 }
 
+# Matches any tone-marked vowel; the scan for the first one runs in C
+_TONE_MARK_RE = re.compile("[" + "".join(TONE_MARKS) + "]")
+
 # Sampling aggressiveness: higher = focus more on problematic pairs
 # 1.0 = linear, 2.0 = squared, 3.0 = cubed
 SAMPLING_AGGRESSIVENESS = 3.0
 
+# Problem type ids used on every sample
+TONE_1_PTID = make_problem_type_id("tone", 1)
+TONE_2_PTID = make_problem_type_id("tone", 2)
+
+# All 15 (6 choose 2) tone pairs, 1-indexed with a < b. Shared and immutable.
+_ALL_PAIRS: tuple[tuple[int, int], ...] = tuple(
+    itertools.combinations(range(1, N_TONES + 1), 2)
+)
+
+# All 15 (6 choose 4) four-choice sets, 1-indexed. Shared and immutable.
+_ALL_FOUR_CHOICE_SETS: tuple[tuple[int, ...], ...] = tuple(
+    tuple(t for t in range(1, N_TONES + 1) if t != exclude1 and t != exclude2)
+    for exclude1 in range(1, N_TONES + 1)
+    for exclude2 in range(exclude1 + 1, N_TONES + 1)
+)
+
+# The 6 (a, b) pair keys within each four-choice set, in the same order
+_PAIR_KEYS_PER_SET: tuple[tuple[tuple[int, int], ...], ...] = tuple(
+    tuple(itertools.combinations(s, 2)) for s in _ALL_FOUR_CHOICE_SETS
+)
 
-class Word(BaseModel):
+# For each tone, the other tones a distractor syllable can switch to
+_OTHER_TONES: dict[int, tuple[int, ...]] = {
+    t: tuple(c for c in range(1, N_TONES + 1) if c != t) for t in range(1, N_TONES + 1)
+}
+
+# Probability that each syllable's tone is changed in a random distractor,
+# as a threshold on 32-bit random chunks
+DISTRACTOR_MUTATION_PROBABILITY = 0.7
+_MUTATION_THRESHOLD = int(DISTRACTOR_MUTATION_PROBABILITY * 2**32)
+
+# Sequences up to this length get distractors drawn from the full enumeration
+# of tone sequences (at most 6^2 = 36) instead of by rejection sampling
+MAX_ENUMERATED_DISTRACTOR_LENGTH = 2
+
+
+@dataclass(slots=True, frozen=True)
+class Word:
     id: int
     vietnamese: str
     english: str
@@ -67,17 +110,41 @@ class Word(BaseModel):
 
 def detect_tone(syllable: str) -> int:
     """Detect the tone of a Vietnamese syllable (1-indexed)."""
-    normalized = syllable.lower().strip()
-    for char in normalized:
-        if char in TONE_MARKS:
-            return TONE_MARKS[char]
-    return 1  # Level tone (ngang)
+    match = _TONE_MARK_RE.search(syllable.lower())
+    if match is None:
+        return 1  # Level tone (ngang)
+    return TONE_MARKS[match.group()]
 
 
-def get_tone_sequence(word: str) -> list[int]:
-    """Get the tone sequence for a word (list of 1-indexed tone IDs)."""
+@functools.lru_cache(maxsize=4096)
+def _cached_tone_sequence(word: str) -> tuple[int, ...]:
     syllables = word.strip().split()
-    return [detect_tone(s) for s in syllables if s]
+    return tuple(detect_tone(s) for s in syllables if s)
+
+
+def get_tone_sequence(word: str) -> list[int]:
+    """Get the tone sequence for a word (list of 1-indexed tone IDs).
+
+    Results are memoized per string; a fresh list is returned each call so
+    callers may mutate it.
+    """
+    return list(_cached_tone_sequence(word))
+
+
+def _mutate_sequence(sequence: list[int], rng: random.Random) -> list[int]:
+    """Change each tone to a random other tone with DISTRACTOR_MUTATION_PROBABILITY.
+
+    Uses a single random draw (32 bits per syllable) for the per-syllable coin flips.
+    """
+    bits = rng.getrandbits(32 * len(sequence))
+    new_seq = []
+    for cls in sequence:
+        if (bits & 0xFFFFFFFF) < _MUTATION_THRESHOLD:
+            new_seq.append(rng.choice(_OTHER_TONES[cls]))
+        else:
+            new_seq.append(cls)
+        bits >>= 32
+    return new_seq
 
 
 class DrillService:
@@ -92,23 +159,81 @@ class DrillService:
 
     def __init__(self):
         self.ml = get_ml_service()
+        # Per-service RNG (can be seeded for reproducible sampling)
+        self._rng = random.Random()
         self._words: list[Word] = []
-        self._words_by_sequence: dict[str, list[Word]] = {}
+        self._words_by_sequence: dict[tuple[int, ...], tuple[Word, ...]] = {}
+        # Initial states depend only on problem type; states are never mutated in place
+        self._initial_states: dict[str, ConfusionState] = {}
+        self._initial_totals: dict[str, float] = {}
         self._load_words()
+        # Single-syllable words indexed directly by tone (index 0 unused)
+        self._words_by_tone: list[tuple[Word, ...]] = [
+            self._words_by_sequence.get((t,), ()) for t in range(N_TONES + 1)
+        ]
+        # Tones that have at least one single-syllable word
+        self._nonempty_tones: frozenset[int] = frozenset(
+            t for t in range(1, N_TONES + 1) if self._words_by_tone[t]
+        )
+        # Sequence keys bucketed by syllable count
+        self._keys_by_length: dict[int, list[tuple[int, ...]]] = {}
+        for k in self._words_by_sequence:
+            self._keys_by_length.setdefault(len(k), []).append(k)
+        self._two_syllable_keys = self._keys_by_length.get(2, [])
+        # First non-empty sequence, used by _sample_fallback
+        self._fallback_key: Optional[tuple[int, ...]] = next(
+            (k for k, words in self._words_by_sequence.items() if words), None
+        )
+        self._four_choice_probes = self._build_four_choice_probes()
+        self._four_choice_probe_list = [
+            probe for _, probes in self._four_choice_probes for probe in probes
+        ]
 
     def _load_words(self):
         """Load words from JSON file and index by tone sequence."""
-        if WORDS_PATH.exists():
-            with open(WORDS_PATH) as f:
-                data = json.load(f)
-                self._words = [Word(**w) for w in data]
-
+        if not WORDS_PATH.exists():
+            return
+
+        raw = WORDS_PATH.read_bytes()
+        data = orjson.loads(raw)
+        # words.json is trusted local data, so no validation
+        self._words = [
+            Word(w["id"], w["vietnamese"], w["english"], w.get("imageUrl"))
+            for w in data
+        ]
+
+        words_by_sequence: dict[tuple[int, ...], list[Word]] = {}
         for word in self._words:
-            sequence = get_tone_sequence(word.vietnamese)
-            key = "-".join(str(t) for t in sequence)
-            if key not in self._words_by_sequence:
-                self._words_by_sequence[key] = []
-            self._words_by_sequence[key].append(word)
+            key = _cached_tone_sequence(word.vietnamese)
+            words_by_sequence.setdefault(key, []).append(word)
+        # Buckets are read-only after load
+        self._words_by_sequence = {k: tuple(v) for k, v in words_by_sequence.items()}
+
+    def _get_initial_state(self, problem_type_id: str) -> ConfusionState:
+        """Get the initial (prior) state for a problem type, cached per service."""
+        state = self._initial_states.get(problem_type_id)
+        if state is None:
+            state = self.ml.get_initial_state(problem_type_id)
+            self._initial_states[problem_type_id] = state
+        return state
+
+    def _get_state(
+        self, states: dict[str, ConfusionState], problem_type_id: str
+    ) -> ConfusionState:
+        """Get the user's state for a problem type, or the cached initial state."""
+        state = states.get(problem_type_id)
+        if state is None:
+            state = self._get_initial_state(problem_type_id)
+        return state
+
+    def _get_initial_total(self, problem_type_id: str) -> float:
+        """Get the sum of prior counts in the initial state, cached per service."""
+        total = self._initial_totals.get(problem_type_id)
+        if total is None:
+            initial = self._get_initial_state(problem_type_id)
+            total = sum(map(sum, initial.counts))
+            self._initial_totals[problem_type_id] = total
+        return total
 
     def process_answer_and_get_next(
         self,
@@ -131,92 +256,119 @@ class DrillService:
         # Update state if answer provided
         if problem and answer:
             problem_type_id = problem.problem_type_id
-            state = states.get(problem_type_id)
-            if state is None:
-                state = self.ml.get_initial_state(problem_type_id)
+            state = self._get_state(states, problem_type_id)
 
             new_state, updates = self.ml.update_state(state, problem, answer)
             states[problem_type_id] = new_state
             all_updates.extend(updates)
 
         # Determine difficulty level for single-syllable
-        state_1 = states.get(make_problem_type_id("tone", 1))
-        if state_1 is None:
-            state_1 = self.ml.get_initial_state(make_problem_type_id("tone", 1))
+        state_1 = self._get_state(states, TONE_1_PTID)
 
-        difficulty = self._get_difficulty_level(state_1)
+        # Pair stats are reused by difficulty check and sampling (state is fixed here)
+        pair_stats = self.ml.get_all_pair_stats(TONE_1_PTID, state_1)
+
+        difficulty = self._get_difficulty_level(state_1, pair_stats)
 
         # Sample next problem
-        next_problem = self._sample_problem(difficulty, states)
+        next_problem = self._sample_problem(difficulty, states, pair_stats)
 
         return next_problem, states, all_updates
 
-    def _get_difficulty_level(self, state: ConfusionState) -> DifficultyLevel:
+    def _get_difficulty_level(
+        self,
+        state: ConfusionState,
+        pair_stats: Optional[dict[tuple[int, int], BetaParams]] = None,
+    ) -> DifficultyLevel:
         """Determine current difficulty level based on mastery.
 
         Uses ML layer to get probabilities, applies thresholds here.
+        pair_stats may be passed in if already computed for this state.
 
         Progression:
         1. 2-choice (1-syllable) → exit when 80% all pairs
         2. mixed (4-choice 1-syl + 2-choice 2-syl) → exit when 90% on 4-choice sets
         3. 4-choice-multi (4-choice 2-syllable)
+
+        The level is memoized on the state until its counts change, so the
+        router's stats fields reuse the level computed while sampling.
         """
-        problem_type_id = make_problem_type_id("tone", 1)
+        return state.derived(
+            (self.ml, "difficulty_level"),
+            lambda: self._compute_difficulty_level(
+                state,
+                pair_stats if pair_stats is not None
+                else self.ml.get_all_pair_stats(TONE_1_PTID, state),
+            ),
+        )
 
+    def _compute_difficulty_level(
+        self,
+        state: ConfusionState,
+        pair_stats: dict[tuple[int, int], BetaParams],
+    ) -> DifficultyLevel:
+        """Uncached _get_difficulty_level."""
         # Check pair mastery (2-choice)
-        pair_stats = self.ml.get_all_pair_stats(problem_type_id, state)
-        for (a, b), beta in pair_stats.items():
-            if beta.mean < PAIR_MASTERY_THRESHOLD:
-                return "2-choice"
+        if any(beta.mean < PAIR_MASTERY_THRESHOLD for beta in pair_stats.values()):
+            return "2-choice"
 
         # Check four-choice mastery using actual 4-choice success probability
-        all_sets = self._get_all_four_choice_sets()
-        for s in all_sets:
-            # For each class in the set, compute 4-choice success probability
-            for correct_class in s:
-                dummy_problem = Problem(
-                    problem_type_id=problem_type_id,
-                    word_id=0,
-                    vietnamese="",
-                    english="",
-                    correct_index=0,
-                    correct_sequence=[correct_class],
-                    alternatives=[[c] for c in s],
-                )
-                beta = self.ml.get_success_distribution(dummy_problem, state)
-                if beta.mean < FOUR_CHOICE_MASTERY_THRESHOLD:
-                    return "mixed"
+        # for each class in each set (stops at the first unmastered one)
+        if any(
+            self.ml.get_success_distribution(probe, state).mean < FOUR_CHOICE_MASTERY_THRESHOLD
+            for _, probes in self._four_choice_probes
+            for probe in probes
+        ):
+            return "mixed"
 
         return "4-choice-multi"
 
     def _get_total_attempts(self, state: ConfusionState) -> int:
         """Get total attempts from confusion matrix."""
         # Sum all counts and subtract prior
-        total = sum(sum(row) for row in state.counts)
-        # Subtract initial prior
-        initial = self.ml.get_initial_state(make_problem_type_id("tone", 1))
-        initial_total = sum(sum(row) for row in initial.counts)
-        return int(total - initial_total)
-
-    def _get_all_pairs(self) -> list[tuple[int, int]]:
-        """Get all pairs of tone classes. Returns 1-indexed."""
-        pairs = []
-        for a in range(1, N_TONES + 1):
-            for b in range(a + 1, N_TONES + 1):
-                pairs.append((a, b))
-        return pairs
-
-    def _get_all_four_choice_sets(self) -> list[list[int]]:
+        total = sum(map(sum, state.counts))
+        return int(total - self._get_initial_total(TONE_1_PTID))
+
+    def _get_all_pairs(self) -> tuple[tuple[int, int], ...]:
+        """Get all pairs of tone classes. Returns 1-indexed.
+
+        The result is shared; do not mutate it.
+        """
+        return _ALL_PAIRS
+
+    def _get_all_four_choice_sets(self) -> tuple[tuple[int, ...], ...]:
         """Get all possible 4-choice sets. Returns 1-indexed.
 
-        Returns all 15 sets (6 choose 4) for 6 tones.
+        Returns all 15 sets (6 choose 4) for 6 tones. The result is shared;
+        do not mutate it.
+        """
+        return _ALL_FOUR_CHOICE_SETS
+
+    def _build_four_choice_probes(self) -> list[tuple[tuple[int, ...], list[Problem]]]:
+        """Build synthetic problems for every (4-choice set, correct class).
+
+        These only depend on the number of classes, so they are built once
+        and reused for mastery checks and stats.
         """
-        sets = []
-        for exclude1 in range(1, N_TONES + 1):
-            for exclude2 in range(exclude1 + 1, N_TONES + 1):
-                s = [t for t in range(1, N_TONES + 1) if t != exclude1 and t != exclude2]
-                sets.append(s)
-        return sets
+        problem_type_id = TONE_1_PTID
+        return [
+            (
+                s,
+                [
+                    Problem(
+                        problem_type_id=problem_type_id,
+                        word_id=0,
+                        vietnamese="",
+                        english="",
+                        correct_index=0,
+                        correct_sequence=[correct_class],
+                        alternatives=[[c] for c in s],
+                    )
+                    for correct_class in s
+                ],
+            )
+            for s in self._get_all_four_choice_sets()
+        ]
 
     def get_four_choice_stats(
         self, state: ConfusionState
@@ -229,28 +381,15 @@ class DrillService:
         - beta: Beta distribution beta
         - mean: mean success probability
         """
-        problem_type_id = make_problem_type_id("tone", 1)
-        all_sets = self._get_all_four_choice_sets()
-
-        if not all_sets:
-            return []
-
+        # Score every (set, correct class) probe in one batch, in set order
+        betas = iter(self.ml.batch_success_distribution(self._four_choice_probe_list, state))
         results = []
-        for s in all_sets:
+        for s, probes in self._four_choice_probes:
             # Compute average success probability across all classes in the set
             total_alpha = 0.0
             total_beta = 0.0
-            for correct_class in s:
-                dummy_problem = Problem(
-                    problem_type_id=problem_type_id,
-                    word_id=0,
-                    vietnamese="",
-                    english="",
-                    correct_index=0,
-                    correct_sequence=[correct_class],
-                    alternatives=[[c] for c in s],
-                )
-                beta_params = self.ml.get_success_distribution(dummy_problem, state)
+            for _ in probes:
+                beta_params = next(betas)
                 total_alpha += beta_params.alpha
                 total_beta += beta_params.beta
 
@@ -259,7 +398,7 @@ class DrillService:
             avg_beta = total_beta / len(s)
 
             results.append({
-                "set": s,
+                "set": list(s),
                 "alpha": avg_alpha,
                 "beta": avg_beta,
                 "mean": avg_alpha / (avg_alpha + avg_beta),
@@ -271,14 +410,18 @@ class DrillService:
         self,
         difficulty: DifficultyLevel,
         states: dict[str, ConfusionState],
+        pair_stats: dict[tuple[int, int], BetaParams],
     ) -> Problem:
-        """Sample the next problem based on difficulty level."""
+        """Sample the next problem based on difficulty level.
+
+        pair_stats are the tone_1 pair stats for this request.
+        """
         # 20% preview of next level
-        if random.random() < PREVIEW_PROBABILITY:
+        if self._rng.random() < PREVIEW_PROBABILITY:
             if difficulty == "2-choice":
                 # Preview mixed level (either 4-choice 1-syl or 2-choice 2-syl)
-                if random.random() < 0.5:
-                    problem = self._sample_4_choice(states)
+                if self._rng.random() < 0.5:
+                    problem = self._sample_4_choice(states, pair_stats)
                 else:
                     problem = self._sample_2_choice_multi_syllable(states)
                 if problem:
@@ -290,11 +433,11 @@ class DrillService:
                     return problem
 
         if difficulty == "2-choice":
-            problem = self._sample_2_choice(states)
+            problem = self._sample_2_choice(states, pair_stats)
         elif difficulty == "mixed":
             # 50/50 between 4-choice 1-syllable and 2-choice 2-syllable
-            if random.random() < 0.5:
-                problem = self._sample_4_choice(states)
+            if self._rng.random() < 0.5:
+                problem = self._sample_4_choice(states, pair_stats)
             else:
                 problem = self._sample_2_choice_multi_syllable(states)
         else:  # 4-choice-multi
@@ -306,44 +449,42 @@ class DrillService:
         # Fallback
         return self._sample_fallback()
 
-    def _sample_2_choice(self, states: dict[str, ConfusionState]) -> Optional[Problem]:
-        """Sample a 2-choice drill weighted by error probability."""
-        problem_type_id = make_problem_type_id("tone", 1)
-        state = states.get(problem_type_id)
-        if state is None:
-            state = self.ml.get_initial_state(problem_type_id)
-
-        pair_stats = self.ml.get_all_pair_stats(problem_type_id, state)
-        pairs = list(pair_stats.keys())
+    def _sample_2_choice(
+        self,
+        states: dict[str, ConfusionState],
+        pair_stats: dict[tuple[int, int], BetaParams],
+    ) -> Optional[Problem]:
+        """Sample a 2-choice drill weighted by error probability.
 
-        # Weight by error probability (aggressive: raise to power)
-        error_probs = []
-        for p in pairs:
-            if p in pair_stats:
-                error = 1 - pair_stats[p].mean
-            else:
-                error = 0.5  # Default for new pairs
-            # Raise to power for more aggressive focus on problematic pairs
-            error_probs.append(error ** SAMPLING_AGGRESSIVENESS)
+        pair_stats are the tone_1 pair stats for this request.
+        """
+        problem_type_id = TONE_1_PTID
+        # Weight by error probability (aggressive: raise to power), in the
+        # fixed _ALL_PAIRS order; 0.5 is the default error for missing pairs
+        error_probs = [
+            (1 - beta.mean if (beta := pair_stats.get(p)) is not None else 0.5)
+            ** SAMPLING_AGGRESSIVENESS
+            for p in _ALL_PAIRS
+        ]
 
-        selected_pair = pairs[self._weighted_sample(error_probs)]
+        selected_pair = _ALL_PAIRS[self._weighted_sample(error_probs)]
 
         # Sample class from pair
-        selected_class = selected_pair[0] if random.random() < 0.5 else selected_pair[1]
+        selected_class = selected_pair[0] if self._rng.random() < 0.5 else selected_pair[1]
 
         # Find word
-        words = self._words_by_sequence.get(str(selected_class), [])
+        words = self._words_by_tone[selected_class]
         if not words:
             # Try other class
             other_class = selected_pair[1] if selected_class == selected_pair[0] else selected_pair[0]
-            words = self._words_by_sequence.get(str(other_class), [])
+            words = self._words_by_tone[other_class]
             if words:
                 selected_class = other_class
 
         if not words:
             return None
 
-        word = random.choice(words)
+        word = self._rng.choice(words)
 
         return Problem(
             problem_type_id=problem_type_id,
@@ -355,36 +496,31 @@ class DrillService:
             alternatives=[[selected_pair[0]], [selected_pair[1]]],
         )
 
-    def _sample_4_choice(self, states: dict[str, ConfusionState]) -> Optional[Problem]:
-        """Sample a 4-choice drill."""
-        problem_type_id = make_problem_type_id("tone", 1)
-        state = states.get(problem_type_id)
-        if state is None:
-            state = self.ml.get_initial_state(problem_type_id)
+    def _sample_4_choice(
+        self,
+        states: dict[str, ConfusionState],
+        pair_stats: dict[tuple[int, int], BetaParams],
+    ) -> Optional[Problem]:
+        """Sample a 4-choice drill.
 
-        pair_stats = self.ml.get_all_pair_stats(problem_type_id, state)
+        pair_stats are the tone_1 pair stats for this request.
+        """
+        problem_type_id = TONE_1_PTID
         all_sets = self._get_all_four_choice_sets()
 
         # Use predefined sets weighted by error probability
         error_probs = []
-        for s in all_sets:
-            total_error = 0
-            count = 0
-            for i, a in enumerate(s):
-                for b in s[i+1:]:
-                    pair_key = (min(a, b), max(a, b))
-                    if pair_key in pair_stats:
-                        total_error += 1 - pair_stats[pair_key].mean
-                        count += 1
-            error_probs.append(total_error / max(count, 1))
+        for pair_keys in _PAIR_KEYS_PER_SET:
+            errors = [1 - pair_stats[k].mean for k in pair_keys if k in pair_stats]
+            error_probs.append(sum(errors) / max(len(errors), 1))
         selected_set = all_sets[self._weighted_sample(error_probs)]
 
-        # Find word with tone class from this set
-        random.shuffle(selected_set)
+        # Find word with tone class from this set (shuffled copy; sets are shared)
+        selected_set = self._rng.sample(selected_set, len(selected_set))
         for cls in selected_set:
-            words = self._words_by_sequence.get(str(cls), [])
+            words = self._words_by_tone[cls]
             if words:
-                word = random.choice(words)
+                word = self._rng.choice(words)
                 return Problem(
                     problem_type_id=problem_type_id,
                     word_id=word.id,
@@ -401,31 +537,25 @@ class DrillService:
         self, states: dict[str, ConfusionState]
     ) -> Optional[Problem]:
         """Sample a 2-choice multi-syllable drill (2 alternatives)."""
-        # Get 2-syllable words
-        two_syllable_keys = [k for k in self._words_by_sequence.keys()
-                           if len(k.split('-')) == 2]
-
+        two_syllable_keys = self._two_syllable_keys
         if not two_syllable_keys:
             return None
 
-        problem_type_id = make_problem_type_id("tone", 2)
-        state = states.get(problem_type_id)
-        if state is None:
-            state = self.ml.get_initial_state(problem_type_id)
+        problem_type_id = TONE_2_PTID
 
         # Simple random for now
-        key = random.choice(two_syllable_keys)
-        words = self._words_by_sequence.get(key, [])
+        key = self._rng.choice(two_syllable_keys)
+        words = self._words_by_sequence.get(key, ())
         if not words:
             return None
 
-        word = random.choice(words)
-        correct_sequence = [int(t) for t in key.split('-')]
+        word = self._rng.choice(words)
+        correct_sequence = list(key)
 
         # Generate just 1 distractor (2-choice)
         distractor = self._generate_single_distractor(correct_sequence)
         alternatives = [correct_sequence, distractor]
-        random.shuffle(alternatives)
+        self._rng.shuffle(alternatives)
 
         return Problem(
             problem_type_id=problem_type_id,
@@ -441,26 +571,20 @@ class DrillService:
         self, states: dict[str, ConfusionState]
     ) -> Optional[Problem]:
         """Sample a 4-choice multi-syllable drill (4 alternatives)."""
-        # Get 2-syllable words
-        two_syllable_keys = [k for k in self._words_by_sequence.keys()
-                           if len(k.split('-')) == 2]
-
+        two_syllable_keys = self._two_syllable_keys
         if not two_syllable_keys:
             return None
 
-        problem_type_id = make_problem_type_id("tone", 2)
-        state = states.get(problem_type_id)
-        if state is None:
-            state = self.ml.get_initial_state(problem_type_id)
+        problem_type_id = TONE_2_PTID
 
         # Simple random for now
-        key = random.choice(two_syllable_keys)
-        words = self._words_by_sequence.get(key, [])
+        key = self._rng.choice(two_syllable_keys)
+        words = self._words_by_sequence.get(key, ())
         if not words:
             return None
 
-        word = random.choice(words)
-        correct_sequence = [int(t) for t in key.split('-')]
+        word = self._rng.choice(words)
+        correct_sequence = list(key)
         alternatives = self._generate_distractors(correct_sequence)
 
         return Problem(
@@ -475,25 +599,25 @@ class DrillService:
 
     def _sample_fallback(self) -> Problem:
         """Sample any word as fallback."""
-        for key, words in self._words_by_sequence.items():
-            if words:
-                word = random.choice(words)
-                correct_sequence = [int(t) for t in key.split('-')]
-                problem_type_id = make_problem_type_id("tone", len(correct_sequence))
-                alternatives = self._generate_distractors(correct_sequence)
-                return Problem(
-                    problem_type_id=problem_type_id,
-                    word_id=word.id,
-                    vietnamese=word.vietnamese,
-                    english=word.english,
-                    correct_index=0,
-                    correct_sequence=correct_sequence,
-                    alternatives=alternatives,
-                )
+        key = self._fallback_key
+        if key is not None:
+            word = self._rng.choice(self._words_by_sequence[key])
+            correct_sequence = list(key)
+            problem_type_id = make_problem_type_id("tone", len(correct_sequence))
+            alternatives = self._generate_distractors(correct_sequence)
+            return Problem(
+                problem_type_id=problem_type_id,
+                word_id=word.id,
+                vietnamese=word.vietnamese,
+                english=word.english,
+                correct_index=0,
+                correct_sequence=correct_sequence,
+                alternatives=alternatives,
+            )
 
         # Absolute fallback
         return Problem(
-            problem_type_id=make_problem_type_id("tone", 1),
+            problem_type_id=TONE_1_PTID,
             word_id=0,
             vietnamese="xin chào",
             english="hello",
@@ -502,46 +626,75 @@ class DrillService:
             alternatives=[[1], [2]],
         )
 
+    # All tone sequences of a given length, built on first use
+    _sequence_pools: dict[int, list[tuple[int, ...]]] = {}
+
+    @classmethod
+    def _get_sequence_pool(cls, length: int) -> list[tuple[int, ...]]:
+        """Get all tone sequences of the given length."""
+        pool = cls._sequence_pools.get(length)
+        if pool is None:
+            pool = list(itertools.product(range(1, N_TONES + 1), repeat=length))
+            cls._sequence_pools[length] = pool
+        return pool
+
     def _generate_distractors(self, correct_sequence: list[int]) -> list[list[int]]:
-        """Generate distractor sequences."""
-        all_classes = list(range(1, N_TONES + 1))
+        """Generate distractor sequences.
+
+        Short sequences sample 3 distinct distractors from all sequences of the
+        same length; longer ones fall back to rejection sampling.
+        """
+        if 0 < len(correct_sequence) <= MAX_ENUMERATED_DISTRACTOR_LENGTH:
+            correct = tuple(correct_sequence)
+            # 4 draws from the shared pool, dropping the correct one (or the
+            # extra draw) is a uniform 3-subset of the rest without copying it
+            drawn = self._rng.sample(self._get_sequence_pool(len(correct)), 4)
+            others = [seq for seq in drawn if seq != correct][:3]
+            distractors = [correct_sequence] + [list(seq) for seq in others]
+            self._rng.shuffle(distractors)
+            return distractors
+
         distractors = [correct_sequence]
+        seen = {tuple(correct_sequence)}  # O(1) duplicate check
 
         for _ in range(50):
             if len(distractors) >= 4:
                 break
-            new_seq = []
-            for correct_cls in correct_sequence:
-                if random.random() < 0.7:
-                    other_classes = [c for c in all_classes if c != correct_cls]
-                    new_seq.append(random.choice(other_classes))
-                else:
-                    new_seq.append(correct_cls)
-            if new_seq != correct_sequence and new_seq not in distractors:
+            new_seq = _mutate_sequence(correct_sequence, self._rng)
+            key = tuple(new_seq)
+            if key not in seen:
+                seen.add(key)
                 distractors.append(new_seq)
 
-        while len(distractors) < 4:
-            fallback = [(c % N_TONES) + 1 for c in correct_sequence]
-            if fallback not in distractors:
+        # Fallback: shift every tone by the same offset (distinct for each offset)
+        for shift in range(1, N_TONES):
+            if len(distractors) >= 4:
+                break
+            fallback = [(c + shift - 1) % N_TONES + 1 for c in correct_sequence]
+            key = tuple(fallback)
+            if key not in seen:
+                seen.add(key)
                 distractors.append(fallback)
-            else:
-                distractors.append([(i % N_TONES) + 1 for i in range(len(correct_sequence))])
 
-        random.shuffle(distractors)
+        self._rng.shuffle(distractors)
         return distractors
 
     def _generate_single_distractor(self, correct_sequence: list[int]) -> list[int]:
-        """Generate a single distractor sequence (for 2-choice)."""
-        all_classes = list(range(1, N_TONES + 1))
+        """Generate a single distractor sequence (for 2-choice).
+
+        Short sequences draw uniformly from the other sequences of the same
+        length, as _generate_distractors does; longer ones mutate.
+        """
+        if 0 < len(correct_sequence) <= MAX_ENUMERATED_DISTRACTOR_LENGTH:
+            correct = tuple(correct_sequence)
+            pool = self._get_sequence_pool(len(correct))
+            while True:
+                seq = self._rng.choice(pool)
+                if seq != correct:
+                    return list(seq)
 
         for _ in range(50):
-            new_seq = []
-            for correct_cls in correct_sequence:
-                if random.random() < 0.7:
-                    other_classes = [c for c in all_classes if c != correct_cls]
-                    new_seq.append(random.choice(other_classes))
-                else:
-                    new_seq.append(correct_cls)
+            new_seq = _mutate_sequence(correct_sequence, self._rng)
             if new_seq != correct_sequence:
                 return new_seq
 
@@ -550,29 +703,27 @@ class DrillService:
         distractor[0] = (distractor[0] % N_TONES) + 1
         return distractor
 
-    @staticmethod
-    def _weighted_sample(weights: list[float]) -> int:
-        """Sample an index proportional to weights."""
-        total = sum(weights)
+    def _weighted_sample(self, weights: list[float]) -> int:
+        """Sample an index proportional to weights (uniform if all are zero)."""
+        cdf = list(itertools.accumulate(weights))
+        total = cdf[-1]
         if total == 0:
-            return random.randint(0, len(weights) - 1)
-
-        r = random.random() * total
-        for i, w in enumerate(weights):
-            r -= w
-            if r <= 0:
-                return i
-        return len(weights) - 1
+            return self._rng.randint(0, len(weights) - 1)
+        # First index whose cumulative weight reaches r (one C-level bisect)
+        return bisect.bisect_left(cdf, self._rng.random() * total, 0, len(cdf) - 1)
 
 
-# Singleton instance
-_tone_service: Optional[DrillService] = None
+@functools.cache
+def _get_tone_drill_service() -> DrillService:
+    """Create the singleton DrillService on first use."""
+    return DrillService()
 
 
 def get_drill_service(drill_type: str = "tone") -> DrillService:
-    """Get the singleton DrillService."""
-    global _tone_service
+    """Get the singleton DrillService.
 
-    if _tone_service is None:
-        _tone_service = DrillService()
-    return _tone_service
+    Only tone drills are implemented, so all drill types share one instance
+    (cached without arguments so get_drill_service() and
+    get_drill_service("tone") return the same object).
+    """
+    return _get_tone_drill_service()
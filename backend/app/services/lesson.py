@@ -7,10 +7,15 @@ Tracks mistakes for single review pass at lesson end.
 
 from __future__ import annotations
 
+import asyncio
+import functools
+import heapq
 import random
+import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Callable, Optional
 
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -18,16 +23,36 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.ml import (
     Problem,
     ConfusionState,
-    make_problem_type_id,
     get_ml_service,
 )
 from app.models.progress import DrillAttempt
-from app.services.drill import DrillService, get_drill_service, N_TONES
+from app.services.drill import (
+    DrillService,
+    Word,
+    get_drill_service,
+    N_TONES,
+    TONE_1_PTID,
+    TONE_2_PTID,
+)
+from app.services.state_persistence import load_states
 
 
 # Lesson constants
 DRILLS_PER_LESSON = 10
 
+# Abandoned lesson sessions are dropped after this much idle time, and the
+# least recently used ones once there are more than MAX_LESSON_SESSIONS
+LESSON_SESSION_TTL_SECONDS = 3600
+MAX_LESSON_SESSIONS = 10000
+
+# The tones outside each pair (either order), for filling 4-choice sets
+_PAIR_COMPLEMENT: dict[tuple[int, int], tuple[int, ...]] = {
+    (a, b): tuple(t for t in range(1, N_TONES + 1) if t not in (a, b))
+    for a in range(1, N_TONES + 1)
+    for b in range(1, N_TONES + 1)
+    if a != b
+}
+
 
 class LessonPhase(str, Enum):
     LEARNING = "learning"
@@ -41,7 +66,7 @@ class DrillMode(str, Enum):
     TWO_CHOICE_2SYL = "2-choice-2syl"
 
 
-@dataclass
+@dataclass(slots=True)
 class MistakeRecord:
     """Record of a mistake for review."""
     problem: Problem
@@ -49,12 +74,12 @@ class MistakeRecord:
     user_selected: list[int]
 
 
-@dataclass
+@dataclass(slots=True)
 class LessonState:
     """In-memory state for a lesson session."""
     lesson_id: int                       # Auto-increment per user (for logging)
     theme_id: int                        # Which theme (0-7)
-    theme_pairs: list[tuple[int, int]]   # 1-indexed tone pairs
+    theme_pairs: tuple[tuple[int, int], ...]  # 1-indexed tone pairs
     drill_sequence: list[DrillMode]      # Pre-planned mode sequence
     current_index: int = 0
     phase: LessonPhase = LessonPhase.LEARNING
@@ -87,26 +112,96 @@ class LessonState:
             }
 
 
+class SessionStore:
+    """In-memory lesson sessions with idle expiry and LRU eviction.
+
+    Supports the dict operations LessonService uses (get, pop, item
+    assignment). Only accessed from the event loop, so no locking.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        # session_id -> (last access time, state), least recently used first
+        self._data: OrderedDict[str, tuple[float, LessonState]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __setitem__(self, session_id: str, state: LessonState) -> None:
+        now = self.clock()
+        self._data[session_id] = (now, state)
+        self._data.move_to_end(session_id)
+        self._evict(now)
+
+    def get(self, session_id: str, default: Optional[LessonState] = None) -> Optional[LessonState]:
+        item = self._data.get(session_id)
+        if item is None:
+            return default
+        now = self.clock()
+        if now - item[0] > self.ttl:
+            del self._data[session_id]
+            return default
+        self._data[session_id] = (now, item[1])
+        self._data.move_to_end(session_id)
+        return item[1]
+
+    def pop(self, session_id: str, default: Optional[LessonState] = None) -> Optional[LessonState]:
+        item = self._data.pop(session_id, None)
+        return default if item is None else item[1]
+
+    def _evict(self, now: float) -> None:
+        """Drop expired sessions and any beyond maxsize, oldest first."""
+        while self._data:
+            last_access, _ = next(iter(self._data.values()))
+            if len(self._data) <= self.maxsize and now - last_access <= self.ttl:
+                break
+            self._data.popitem(last=False)
+
+
 # Lesson themes: each defines 2 focus pairs (1-indexed)
-LESSON_THEMES: list[list[tuple[int, int]]] = [
-    [(1, 2), (1, 3)],  # Level vs Falling/Rising
-    [(2, 3), (2, 4)],  # Falling vs Rising/Dipping
-    [(3, 4), (4, 5)],  # Rising/Dipping/Creaky
-    [(5, 6), (3, 6)],  # Creaky/Heavy
-    [(1, 4), (1, 5)],  # Level vs Dipping/Creaky
-    [(2, 5), (2, 6)],  # Falling vs Creaky/Heavy
-    [(3, 5), (4, 6)],  # Mixed pairs
-    [(1, 6), (2, 3)],  # Mixed advanced
-]
+LESSON_THEMES: tuple[tuple[tuple[int, int], ...], ...] = (
+    ((1, 2), (1, 3)),  # Level vs Falling/Rising
+    ((2, 3), (2, 4)),  # Falling vs Rising/Dipping
+    ((3, 4), (4, 5)),  # Rising/Dipping/Creaky
+    ((5, 6), (3, 6)),  # Creaky/Heavy
+    ((1, 4), (1, 5)),  # Level vs Dipping/Creaky
+    ((2, 5), (2, 6)),  # Falling vs Creaky/Heavy
+    ((3, 5), (4, 6)),  # Mixed pairs
+    ((1, 6), (2, 3)),  # Mixed advanced
+)
 
 
 class LessonService:
     """Service for lesson-based drill sessions."""
 
+    # Unshuffled drill modes for one lesson
+    _BASE_SEQUENCE: tuple[DrillMode, ...] = (
+        (DrillMode.TWO_CHOICE_1SYL,) * 6 +
+        (DrillMode.FOUR_CHOICE_1SYL,) * 2 +
+        (DrillMode.TWO_CHOICE_2SYL,) * 2
+    )
+
     def __init__(self):
         self.drill_service: DrillService = get_drill_service()
         self.ml = get_ml_service()
-        self._sessions: dict[str, LessonState] = {}
+        # Per-service RNG (can be seeded for reproducible lessons)
+        self._rng = random.Random()
+        self._sessions = SessionStore(MAX_LESSON_SESSIONS, LESSON_SESSION_TTL_SECONDS)
+        # 2-syllable (word, tone sequence) candidates per set of theme tones
+        self._2syl_candidates: dict[frozenset[int], tuple[tuple[Word, tuple[int, ...]], ...]] = {}
+        # Themed sampler per drill mode (bound once instead of comparing enums)
+        self._samplers_by_mode = {
+            DrillMode.TWO_CHOICE_1SYL: self._sample_2_choice_themed,
+            DrillMode.FOUR_CHOICE_1SYL: self._sample_4_choice_themed,
+            DrillMode.TWO_CHOICE_2SYL: self._sample_2_choice_2syl_themed,
+        }
 
     async def get_next_lesson_id(
         self,
@@ -121,26 +216,37 @@ class LessonService:
         max_lesson_id = result.scalar_one()
         return max_lesson_id + 1
 
-    async def start_lesson(
+    async def start_lesson_with_states(
         self,
         session_id: str,
         user_id: str,
         db_session: AsyncSession,
+        problem_type_ids: list[str],
         theme_id: Optional[int] = None,
-        states: Optional[dict[str, ConfusionState]] = None,
     ) -> LessonState:
-        """Start a new lesson.
-
-        Args:
-            session_id: Unique session identifier (e.g., user_id + timestamp)
-            user_id: User ID for lesson_id tracking
-            db_session: Database session for querying lesson_id
-            theme_id: Which lesson theme (0-7), or None for adaptive
-            states: ML confusion states for adaptive selection
+        """Start a new lesson, loading the user's ML states alongside the lesson ID.
+
+        The lesson ID query and the state load run concurrently; states are
+        read through a second session on the same engine, since one
+        AsyncSession cannot run two statements at once. Problem types with
+        no stored state get their initial state.
         """
-        # Get next lesson ID
-        lesson_id = await self.get_next_lesson_id(db_session, user_id)
+        async with AsyncSession(bind=db_session.bind) as states_session:
+            lesson_id, states = await asyncio.gather(
+                self.get_next_lesson_id(db_session, user_id),
+                load_states(states_session, user_id, problem_type_ids),
+            )
+
+        return self._create_lesson(session_id, lesson_id, theme_id, states)
 
+    def _create_lesson(
+        self,
+        session_id: str,
+        lesson_id: int,
+        theme_id: Optional[int],
+        states: Optional[dict[str, ConfusionState]],
+    ) -> LessonState:
+        """Select theme and drill sequence and register the lesson session."""
         # Select theme pairs
         if theme_id is not None:
             actual_theme_id = theme_id % len(LESSON_THEMES)
@@ -164,26 +270,27 @@ class LessonService:
     def _select_adaptive_theme(
         self,
         states: Optional[dict[str, ConfusionState]],
-    ) -> list[tuple[int, int]]:
+    ) -> tuple[tuple[int, int], ...]:
         """Select theme based on weakest pairs from ML state."""
         if states is None:
             return LESSON_THEMES[0]
 
-        problem_type_id = make_problem_type_id("tone", 1)
+        problem_type_id = TONE_1_PTID
         state = states.get(problem_type_id)
         if state is None:
             return LESSON_THEMES[0]
 
         pair_stats = self.ml.get_all_pair_stats(problem_type_id, state)
 
-        # Sort by error probability (1 - mean), take 2 weakest
-        sorted_pairs = sorted(
+        # Take the 2 weakest pairs by error probability (1 - mean)
+        weakest = heapq.nsmallest(
+            2,
             pair_stats.items(),
             key=lambda x: x[1].mean,  # Lower mean = more errors
         )
 
-        if len(sorted_pairs) >= 2:
-            return [sorted_pairs[0][0], sorted_pairs[1][0]]
+        if len(weakest) >= 2:
+            return (weakest[0][0], weakest[1][0])
         return LESSON_THEMES[0]
 
     def _generate_drill_sequence(self) -> list[DrillMode]:
@@ -192,12 +299,8 @@ class LessonService:
         Distribution: 6x 2-choice-1syl, 2x 4-choice-1syl, 2x 2-choice-2syl
         Shuffled randomly.
         """
-        sequence = (
-            [DrillMode.TWO_CHOICE_1SYL] * 6 +
-            [DrillMode.FOUR_CHOICE_1SYL] * 2 +
-            [DrillMode.TWO_CHOICE_2SYL] * 2
-        )
-        random.shuffle(sequence)
+        sequence = list(self._BASE_SEQUENCE)
+        self._rng.shuffle(sequence)
         return sequence
 
     def get_next_drill(
@@ -256,42 +359,38 @@ class LessonService:
     def _sample_drill_for_mode(
         self,
         mode: DrillMode,
-        theme_pairs: list[tuple[int, int]],
+        theme_pairs: tuple[tuple[int, int], ...],
         states: dict[str, ConfusionState],
     ) -> Problem:
         """Sample a drill constrained to mode and theme pairs."""
-        if mode == DrillMode.TWO_CHOICE_1SYL:
-            return self._sample_2_choice_themed(theme_pairs, states)
-        elif mode == DrillMode.FOUR_CHOICE_1SYL:
-            return self._sample_4_choice_themed(theme_pairs, states)
-        else:  # TWO_CHOICE_2SYL
-            return self._sample_2_choice_2syl_themed(theme_pairs, states)
+        return self._samplers_by_mode[mode](theme_pairs, states)
 
     def _sample_2_choice_themed(
         self,
-        theme_pairs: list[tuple[int, int]],
+        theme_pairs: tuple[tuple[int, int], ...],
         states: dict[str, ConfusionState],
     ) -> Problem:
         """Sample 2-choice drill from theme pairs."""
         # Pick one of the theme pairs
-        pair = random.choice(theme_pairs)
+        pair = self._rng.choice(theme_pairs)
 
         # Sample class from pair
-        selected_class = pair[0] if random.random() < 0.5 else pair[1]
-        words = self.drill_service._words_by_sequence.get(str(selected_class), [])
+        selected_class = pair[0] if self._rng.random() < 0.5 else pair[1]
+        words_by_tone = self.drill_service._words_by_tone
+        words = words_by_tone[selected_class]
 
         if not words:
             # Fallback to other class
             selected_class = pair[1] if selected_class == pair[0] else pair[0]
-            words = self.drill_service._words_by_sequence.get(str(selected_class), [])
+            words = words_by_tone[selected_class]
 
         if not words:
             return self.drill_service._sample_fallback()
 
-        word = random.choice(words)
+        word = self._rng.choice(words)
 
         return Problem(
-            problem_type_id=make_problem_type_id("tone", 1),
+            problem_type_id=TONE_1_PTID,
             word_id=word.id,
             vietnamese=word.vietnamese,
             english=word.english,
@@ -302,39 +401,28 @@ class LessonService:
 
     def _sample_4_choice_themed(
         self,
-        theme_pairs: list[tuple[int, int]],
+        theme_pairs: tuple[tuple[int, int], ...],
         states: dict[str, ConfusionState],
     ) -> Problem:
         """Sample 4-choice drill including at least one theme pair."""
         # Build a 4-choice set that includes both classes from a theme pair
-        pair = random.choice(theme_pairs)
+        pair = self._rng.choice(theme_pairs)
 
         # Add 2 more tones to make 4
-        all_tones = set(range(1, N_TONES + 1))
-        remaining = list(all_tones - set(pair))
-        random.shuffle(remaining)
-        four_set = list(pair) + remaining[:2]
-        random.shuffle(four_set)
-
-        # Pick correct class from the four
-        selected_class = random.choice(four_set)
-        words = self.drill_service._words_by_sequence.get(str(selected_class), [])
-
-        if not words:
-            # Try other classes in set
-            for cls in four_set:
-                words = self.drill_service._words_by_sequence.get(str(cls), [])
-                if words:
-                    selected_class = cls
-                    break
+        four_set = list(pair) + self._rng.sample(_PAIR_COMPLEMENT[pair], 2)
+        self._rng.shuffle(four_set)
 
-        if not words:
+        # Pick correct class from the four, among those that have words
+        nonempty_tones = self.drill_service._nonempty_tones
+        candidates = [c for c in four_set if c in nonempty_tones]
+        if not candidates:
             return self.drill_service._sample_fallback()
 
-        word = random.choice(words)
+        selected_class = self._rng.choice(candidates)
+        word = self._rng.choice(self.drill_service._words_by_tone[selected_class])
 
         return Problem(
-            problem_type_id=make_problem_type_id("tone", 1),
+            problem_type_id=TONE_1_PTID,
             word_id=word.id,
             vietnamese=word.vietnamese,
             english=word.english,
@@ -345,26 +433,12 @@ class LessonService:
 
     def _sample_2_choice_2syl_themed(
         self,
-        theme_pairs: list[tuple[int, int]],
+        theme_pairs: tuple[tuple[int, int], ...],
         states: dict[str, ConfusionState],
     ) -> Problem:
         """Sample 2-syllable drill where one syllable uses theme tone."""
-        # Find 2-syllable words where at least one syllable has a theme tone
-        theme_tones = set()
-        for p in theme_pairs:
-            theme_tones.add(p[0])
-            theme_tones.add(p[1])
-
-        candidates = []
-        candidate_keys = []
-        for key, words in self.drill_service._words_by_sequence.items():
-            parts = key.split('-')
-            if len(parts) == 2:
-                t1, t2 = int(parts[0]), int(parts[1])
-                if t1 in theme_tones or t2 in theme_tones:
-                    for word in words:
-                        candidates.append(word)
-                        candidate_keys.append(key)
+        theme_tones = frozenset(t for p in theme_pairs for t in p)
+        candidates = self._get_2syl_candidates(theme_tones)
 
         if not candidates:
             # Fallback to any 2-syllable
@@ -373,17 +447,15 @@ class LessonService:
                 return problem
             return self.drill_service._sample_fallback()
 
-        idx = random.randrange(len(candidates))
-        word = candidates[idx]
-        key = candidate_keys[idx]
-        correct_sequence = [int(t) for t in key.split('-')]
+        word, key = self._rng.choice(candidates)
+        correct_sequence = list(key)
 
         distractor = self.drill_service._generate_single_distractor(correct_sequence)
         alternatives = [correct_sequence, distractor]
-        random.shuffle(alternatives)
+        self._rng.shuffle(alternatives)
 
         return Problem(
-            problem_type_id=make_problem_type_id("tone", 2),
+            problem_type_id=TONE_2_PTID,
             word_id=word.id,
             vietnamese=word.vietnamese,
             english=word.english,
@@ -392,6 +464,25 @@ class LessonService:
             alternatives=alternatives,
         )
 
+    def _get_2syl_candidates(
+        self, theme_tones: frozenset[int]
+    ) -> tuple[tuple[Word, tuple[int, ...]], ...]:
+        """Get 2-syllable words where at least one syllable has a theme tone.
+
+        Memoized per tone set (at most 2^6 of them); words are fixed after load.
+        """
+        candidates = self._2syl_candidates.get(theme_tones)
+        if candidates is None:
+            words_by_sequence = self.drill_service._words_by_sequence
+            candidates = tuple(
+                (word, key)
+                for key in self.drill_service._two_syllable_keys
+                if key[0] in theme_tones or key[1] in theme_tones
+                for word in words_by_sequence[key]
+            )
+            self._2syl_candidates[theme_tones] = candidates
+        return candidates
+
     def record_answer(
         self,
         session_id: str,
@@ -442,13 +533,7 @@ class LessonService:
         self._sessions.pop(session_id, None)
 
 
-# Singleton
-_lesson_service: Optional[LessonService] = None
-
-
+@functools.cache
 def get_lesson_service() -> LessonService:
     """Get singleton LessonService."""
-    global _lesson_service
-    if _lesson_service is None:
-        _lesson_service = LessonService()
-    return _lesson_service
+    return LessonService()
@@ -3,12 +3,43 @@
 Handles loading and saving ConfusionState to the database.
 """
 
-from datetime import datetime
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import cast
 
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import col
+
+from app.database import async_session_maker
 from app.models.progress import UserState
-from app.ml import ConfusionState, get_ml_service, get_problem_type
+from app.ml import BradleyTerryState, ConfusionState, get_ml_service, get_problem_type
+
+logger = logging.getLogger(__name__)
+
+# State class per stored model_version (1 or missing: confusion matrix)
+_STATE_CLASSES: dict[int, type[ConfusionState]] = {
+    1: ConfusionState,
+    2: BradleyTerryState,
+}
+
+# How long queued state writes may wait before being flushed
+STATE_FLUSH_INTERVAL_SECONDS = 0.1
+
+# After a failed flush the wait doubles, up to this many seconds
+STATE_FLUSH_MAX_BACKOFF_SECONDS = 30.0
+
+# Consecutive failed flushes before queued states are dropped (about 2.5 min)
+STATE_FLUSH_MAX_RETRIES = 12
+
+# Rows per UPSERT statement: 5 bind parameters each, so 995 per statement,
+# within SQLite's 999-variable limit before 3.32 (and asyncpg's 32767)
+STATE_UPSERT_CHUNK_SIZE = 199
 
 
 def _deserialize_state(state_json: dict) -> ConfusionState:
@@ -18,13 +49,8 @@ def _deserialize_state(state_json: dict) -> ConfusionState:
     - model_version=2: BradleyTerryState (pairwise wins)
     - model_version=1 or missing: ConfusionState/LuceState (confusion matrix)
     """
-    model_version = state_json.get("model_version", 1)
-
-    if model_version == 2:
-        from app.ml.luce_service import BradleyTerryState
-        return BradleyTerryState(**state_json)
-    else:
-        return ConfusionState(**state_json)
+    state_class = _STATE_CLASSES.get(state_json.get("model_version", 1), ConfusionState)
+    return state_class.model_validate(state_json)
 
 
 async def load_state(
@@ -37,6 +63,10 @@ async def load_state(
     If no state exists, returns initial state with priors.
     Deserializes to the appropriate state class based on model_version.
     """
+    queued = state_writer.get(user_id, problem_type_id)
+    if queued is not None:
+        return queued
+
     stmt = select(UserState).where(
         UserState.user_id == user_id,
         UserState.problem_type_id == problem_type_id,
@@ -60,48 +90,245 @@ async def save_state(
 ) -> None:
     """Save state for a user and problem type.
 
-    Creates or updates the state record. Uses IntegrityError handling
-    for race condition protection (unique constraint on user_id + problem_type_id).
+    Creates or updates the state record in a single UPSERT on the unique
+    (user_id, problem_type_id) constraint, so concurrent first saves
+    cannot conflict. Supersedes any state queued with queue_state.
     """
-    from sqlalchemy.exc import IntegrityError
+    await state_writer.write_through(session, user_id, problem_type_id, state)
 
-    stmt = select(UserState).where(
-        UserState.user_id == user_id,
-        UserState.problem_type_id == problem_type_id,
-    )
-    result = await session.execute(stmt)
-    user_state = result.scalar_one_or_none()
 
-    if user_state is None:
-        # Create new record
-        user_state = UserState(
-            user_id=user_id,
-            problem_type_id=problem_type_id,
-            state_json=state.model_dump(),
-            updated_at=datetime.utcnow(),
+async def _upsert_states(
+    session: AsyncSession,
+    states: dict[tuple[str, str], ConfusionState],
+) -> None:
+    """Write states keyed by (user_id, problem_type_id) in multi-row UPSERTs.
+
+    Rows go out in statements of at most STATE_UPSERT_CHUNK_SIZE, so a
+    backlog built up while the database was down stays within the driver's
+    bind-parameter limit; all chunks are committed together. All rows share
+    one updated_at timestamp (naive UTC, like the rest of the schema).
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    insert = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "problem_type_id": problem_type_id,
+            "state_json": state.model_dump(),
+            "updated_at": now,
+        }
+        for (user_id, problem_type_id), state in states.items()
+    ]
+    for start in range(0, len(rows), STATE_UPSERT_CHUNK_SIZE):
+        stmt = insert(UserState).values(rows[start:start + STATE_UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserState.user_id, UserState.problem_type_id],
+            set_={
+                "state_json": stmt.excluded.state_json,
+                "updated_at": stmt.excluded.updated_at,
+            },
         )
-        session.add(user_state)
-        try:
-            await session.commit()
-        except IntegrityError:
-            # Race condition: another request created the record
-            await session.rollback()
-            # Retry as update
-            result = await session.execute(
-                select(UserState).where(
-                    UserState.user_id == user_id,
-                    UserState.problem_type_id == problem_type_id,
-                )
+        await session.execute(stmt)
+    await session.commit()
+
+
+class StateWriteBatcher:
+    """Coalesces state saves and writes them in the background.
+
+    Answer handlers queue the updated state and return immediately; a
+    background task flushes everything queued every
+    STATE_FLUSH_INTERVAL_SECONDS with multi-row UPSERTs, so rapid updates
+    to the same (user_id, problem_type_id) collapse into a single write.
+
+    Queued and in-flight states are returned by the load functions, so a
+    user reads back their latest answer even before it is flushed. That
+    overlay is per process: it relies on the app running a single worker
+    (see Procfile). With several workers, a request served by another
+    worker sees the stored state until the flush lands.
+
+    When flushes fail (database down), retries back off exponentially up to
+    STATE_FLUSH_MAX_BACKOFF_SECONDS. After STATE_FLUSH_MAX_RETRIES
+    consecutive failures the queued states are dropped and logged. Since
+    saves coalesce per key, the queue holds at most one state per active
+    (user_id, problem_type_id) meanwhile.
+    """
+
+    def __init__(
+        self,
+        interval: float = STATE_FLUSH_INTERVAL_SECONDS,
+        session_maker: async_sessionmaker[AsyncSession] = async_session_maker,
+    ):
+        self.interval = interval
+        self.session_maker = session_maker
+        self._pending: dict[tuple[str, str], ConfusionState] = {}
+        self._inflight: dict[tuple[str, str], ConfusionState] = {}
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    def queue(self, user_id: str, problem_type_id: str, state: ConfusionState) -> None:
+        """Queue a state to be saved, replacing any not-yet-flushed one."""
+        self._pending[(user_id, problem_type_id)] = state
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def get(self, user_id: str, problem_type_id: str) -> ConfusionState | None:
+        """Return the queued or in-flight state, if it has not been written yet."""
+        key = (user_id, problem_type_id)
+        state = self._pending.get(key)
+        return state if state is not None else self._inflight.get(key)
+
+    def get_all(self, user_id: str) -> dict[str, ConfusionState]:
+        """Return all unwritten states for a user, keyed by problem_type_id."""
+        return {
+            problem_type_id: state
+            for source in (self._inflight, self._pending)
+            for (uid, problem_type_id), state in source.items()
+            if uid == user_id
+        }
+
+    async def write_through(
+        self,
+        session: AsyncSession,
+        user_id: str,
+        problem_type_id: str,
+        state: ConfusionState,
+    ) -> None:
+        """Write a state directly, superseding any queued one for the key.
+
+        Holds the flush lock, so an older batched state for the key cannot
+        be in flight and commit after this write.
+        """
+        async with self._lock:
+            self._pending.pop((user_id, problem_type_id), None)
+            await _upsert_states(session, {(user_id, problem_type_id): state})
+
+    async def delete(
+        self,
+        session: AsyncSession,
+        user_id: str,
+        problem_type_id: str,
+    ) -> bool:
+        """Delete a stored state and drop any queued one for the key.
+
+        Holds the flush lock like write_through, so no batch for the key is
+        in flight and a state queued afterwards is a new one. Returns True
+        if a stored or queued state was removed.
+        """
+        async with self._lock:
+            queued = self._pending.pop((user_id, problem_type_id), None)
+            stmt = delete(UserState).where(
+                UserState.user_id == user_id,
+                UserState.problem_type_id == problem_type_id,
             )
-            user_state = result.scalar_one()
-            user_state.state_json = state.model_dump()
-            user_state.updated_at = datetime.utcnow()
+            # DML results are cursor results, which carry rowcount
+            result = cast(CursorResult, await session.execute(stmt))
             await session.commit()
-    else:
-        # Update existing record
-        user_state.state_json = state.model_dump()
-        user_state.updated_at = datetime.utcnow()
-        await session.commit()
+        return result.rowcount > 0 or queued is not None
+
+    async def flush(self) -> None:
+        """Write all queued states now.
+
+        On failure or cancellation the states stay queued (unless superseded
+        meanwhile) and the error is re-raised.
+        """
+        async with self._lock:
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending, {}
+            try:
+                async with self.session_maker() as session:
+                    await _upsert_states(session, self._inflight)
+            except BaseException:
+                # Also on cancellation (close() during a flush), so the batch
+                # is written by the final flush instead of being lost
+                self._pending = {**self._inflight, **self._pending}
+                raise
+            finally:
+                self._inflight = {}
+
+    async def close(self) -> None:
+        """Stop the background task and flush what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Failed to flush %d states at shutdown", len(self._pending))
+            self._pending = {}
+
+    async def _run(self) -> None:
+        failures = 0
+        while self._pending:
+            delay = self.interval * 2 ** failures
+            await asyncio.sleep(min(delay, STATE_FLUSH_MAX_BACKOFF_SECONDS))
+            try:
+                await self.flush()
+            except Exception:
+                failures += 1
+                if failures >= STATE_FLUSH_MAX_RETRIES:
+                    logger.exception(
+                        "Dropping %d queued states after %d failed flushes",
+                        len(self._pending), failures,
+                    )
+                    self._pending = {}
+                elif failures == 1:
+                    logger.exception("Failed to flush %d states, retrying", len(self._pending))
+                else:
+                    logger.warning(
+                        "Flush retry %d failed for %d states", failures, len(self._pending)
+                    )
+            else:
+                failures = 0
+
+
+state_writer = StateWriteBatcher()
+
+
+def queue_state(
+    user_id: str,
+    problem_type_id: str,
+    state: ConfusionState,
+) -> None:
+    """Queue a state to be saved in the background by the shared batcher."""
+    state_writer.queue(user_id, problem_type_id, state)
+
+
+async def load_states(
+    session: AsyncSession,
+    user_id: str,
+    problem_type_ids: list[str],
+) -> dict[str, ConfusionState]:
+    """Load states for a user and several problem types in one query.
+
+    Returns dict mapping each requested problem_type_id to its state;
+    missing states are filled with the initial state with priors.
+    """
+    # Snapshot unwritten states before querying: a flush finishing during
+    # the query would otherwise leave neither the overlay nor the result
+    # holding the newest state
+    unwritten = state_writer.get_all(user_id)
+    stmt = select(col(UserState.problem_type_id), col(UserState.state_json)).where(
+        UserState.user_id == user_id,
+        col(UserState.problem_type_id).in_(problem_type_ids),
+    )
+    result = await session.execute(stmt)
+    stored = {
+        problem_type_id: _deserialize_state(state_json)
+        for problem_type_id, state_json in result
+    }
+    stored.update(unwritten)
+
+    ml = get_ml_service()
+    return {
+        ptid: stored[ptid] if ptid in stored else ml.get_initial_state(ptid)
+        for ptid in problem_type_ids
+    }
 
 
 async def load_all_states(
@@ -113,14 +340,20 @@ async def load_all_states(
     Returns dict mapping problem_type_id to ConfusionState.
     Missing states are not included (caller should use get_initial_state).
     """
-    stmt = select(UserState).where(UserState.user_id == user_id)
+    # Snapshot unwritten states before querying (see load_states)
+    unwritten = state_writer.get_all(user_id)
+    # Only the two needed columns, without building ORM instances
+    stmt = select(col(UserState.problem_type_id), col(UserState.state_json)).where(
+        UserState.user_id == user_id,
+    )
     result = await session.execute(stmt)
-    user_states = result.scalars().all()
 
-    return {
-        us.problem_type_id: _deserialize_state(us.state_json)
-        for us in user_states
+    states = {
+        problem_type_id: _deserialize_state(state_json)
+        for problem_type_id, state_json in result
     }
+    states.update(unwritten)
+    return states
 
 
 async def delete_state(
@@ -130,18 +363,7 @@ async def delete_state(
 ) -> bool:
     """Delete state for a user and problem type.
 
-    Returns True if deleted, False if not found.
+    Returns True if deleted, False if not found. A state queued for the
+    key but not yet written is dropped as well.
     """
-    stmt = select(UserState).where(
-        UserState.user_id == user_id,
-        UserState.problem_type_id == problem_type_id,
-    )
-    result = await session.execute(stmt)
-    user_state = result.scalar_one_or_none()
-
-    if user_state is None:
-        return False
-
-    await session.delete(user_state)
-    await session.commit()
-    return True
+    return await state_writer.delete(session, user_id, problem_type_id)
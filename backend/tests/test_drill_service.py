@@ -0,0 +1,125 @@
+"""Tests for tone drill difficulty progression and sampling."""
+import random
+
+import pytest
+
+from app.ml import Problem, make_problem_type_id
+from app.services import drill
+from app.services.drill import (
+    DrillService,
+    PAIR_MASTERY_THRESHOLD,
+    FOUR_CHOICE_MASTERY_THRESHOLD,
+)
+
+
+@pytest.fixture(scope="module")
+def service():
+    return DrillService()
+
+
+def reference_difficulty_level(service, state):
+    """Plain nested-loop version of the difficulty rules."""
+    problem_type_id = make_problem_type_id("tone", 1)
+    pair_stats = service.ml.get_all_pair_stats(problem_type_id, state)
+    for beta in pair_stats.values():
+        if beta.mean < PAIR_MASTERY_THRESHOLD:
+            return "2-choice"
+
+    for s in service._get_all_four_choice_sets():
+        for correct_class in s:
+            problem = Problem(
+                problem_type_id=problem_type_id,
+                word_id=0,
+                vietnamese="",
+                correct_index=0,
+                correct_sequence=[correct_class],
+                alternatives=[[c] for c in s],
+            )
+            beta = service.ml.get_success_distribution(problem, state)
+            if beta.mean < FOUR_CHOICE_MASTERY_THRESHOLD:
+                return "mixed"
+
+    return "4-choice-multi"
+
+
+def make_state(service, rng, diagonal):
+    """Random confusion counts with extra weight on the diagonal."""
+    initial = service.ml.get_initial_state(make_problem_type_id("tone", 1))
+    counts = [
+        [c + rng.randint(0, 3) + (diagonal if i == j else 0) for j, c in enumerate(row)]
+        for i, row in enumerate(initial.counts)
+    ]
+    return initial.model_copy(update={"counts": counts})
+
+
+class TestDifficultyLevel:
+    """The fast difficulty check must match the reference rules."""
+
+    def test_matches_reference(self, service):
+        rng = random.Random(0)
+        seen = set()
+        for diagonal in (0, 5, 20, 60, 200, 1000):
+            for _ in range(20):
+                state = make_state(service, rng, diagonal)
+                expected = reference_difficulty_level(service, state)
+                assert service._get_difficulty_level(state) == expected
+                seen.add(expected)
+
+        assert seen == {"2-choice", "mixed", "4-choice-multi"}
+
+    def test_initial_state_is_2_choice(self, service):
+        state = service.ml.get_initial_state(make_problem_type_id("tone", 1))
+        assert service._get_difficulty_level(state) == "2-choice"
+
+    def test_level_follows_state_updates(self, service):
+        rng = random.Random(1)
+        state = make_state(service, rng, 1000)
+        assert service._get_difficulty_level(state) == "4-choice-multi"
+
+        # Confuse tone 1 with tone 2 until the pair drops below mastery
+        updated = state
+        for _ in range(2000):
+            updated = updated.copy_with_increment(1, 2)
+        assert service._get_difficulty_level(updated) == "2-choice"
+        assert service._get_difficulty_level(state) == "4-choice-multi"
+
+
+class TestDistractors:
+    """Distractor sets must contain the correct answer plus 3 distinct others."""
+
+    @pytest.mark.parametrize("correct", [[1], [6], [2, 3], [4, 4], [1, 5, 6]])
+    def test_four_distinct_choices(self, service, correct):
+        for _ in range(50):
+            choices = service._generate_distractors(list(correct))
+            assert len(choices) == 4
+            assert correct in choices
+            assert len({tuple(c) for c in choices}) == 4
+            assert all(len(c) == len(correct) for c in choices)
+
+    @pytest.mark.parametrize("correct", [[1], [6], [2, 3], [4, 4], [1, 5, 6]])
+    def test_single_distractor_differs(self, service, correct):
+        for _ in range(50):
+            distractor = service._generate_single_distractor(list(correct))
+            assert distractor != correct
+            assert len(distractor) == len(correct)
+            assert all(1 <= c <= 6 for c in distractor)
+
+    def test_fallback_choices_are_distinct(self, service, monkeypatch):
+        # Mutation never changes anything, so only the fallback can fill the set
+        monkeypatch.setattr(drill, "_mutate_sequence", lambda seq, rng: list(seq))
+        choices = service._generate_distractors([2, 2, 5])
+        assert [2, 2, 5] in choices
+        assert len({tuple(c) for c in choices}) == 4
+
+
+class TestSeeding:
+    """Sampling draws only from the service's own RNG."""
+
+    def test_seeded_services_sample_identically(self):
+        a, b = DrillService(), DrillService()
+        a._rng.seed(1234)
+        b._rng.seed(1234)
+        for _ in range(50):
+            pa, _, _ = a.process_answer_and_get_next(None, None, {})
+            pb, _, _ = b.process_answer_and_get_next(None, None, {})
+            assert pa == pb
@@ -0,0 +1,75 @@
+"""Tests for lesson sessions: the session store and seeded sampling."""
+from app.services.lesson import LessonService, LessonState, SessionStore
+
+
+def make_state(lesson_id):
+    return LessonState(lesson_id=lesson_id, theme_id=0, theme_pairs=(), drill_sequence=[])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionStore:
+    def test_get_set_pop(self):
+        store = SessionStore(maxsize=10, ttl=60)
+        state = make_state(1)
+        store["a"] = state
+        assert store.get("a") is state
+        assert store.pop("a") is state
+        assert store.get("a") is None
+        assert store.pop("a") is None
+
+    def test_evicts_least_recently_used(self):
+        store = SessionStore(maxsize=2, ttl=60)
+        store["a"] = make_state(1)
+        store["b"] = make_state(2)
+        store.get("a")  # "b" is now least recently used
+        store["c"] = make_state(3)
+        assert len(store) == 2
+        assert store.get("b") is None
+        assert store.get("a") is not None
+        assert store.get("c") is not None
+
+    def test_expires_idle_sessions(self):
+        clock = FakeClock()
+        store = SessionStore(maxsize=10, ttl=60, clock=clock)
+        store["a"] = make_state(1)
+        store["b"] = make_state(2)
+
+        clock.now = 50
+        assert store.get("a") is not None  # access refreshes "a"
+
+        clock.now = 100
+        assert store.get("b") is None
+        assert store.get("a") is not None
+
+        # Setting a new session drops expired ones
+        clock.now = 200
+        store["c"] = make_state(3)
+        assert len(store) == 1
+
+
+def run_lesson(service, seed):
+    """Play a whole lesson with seeded RNGs, answering every 3rd drill wrong."""
+    service._rng.seed(seed)
+    service.drill_service._rng.seed(seed)
+    service._create_lesson("s", lesson_id=1, theme_id=None, states=None)
+    drills = []
+    while (result := service.get_next_drill("s", {})) is not None:
+        problem, mode, progress = result
+        drills.append((problem, mode, progress))
+        service.record_answer("s", problem, mode, [1], len(drills) % 3 != 0)
+    return drills
+
+
+class TestSeeding:
+    """Lesson sampling draws only from the service RNGs."""
+
+    def test_seeded_lessons_are_identical(self):
+        a, b = LessonService(), LessonService()
+        assert run_lesson(a, 42) == run_lesson(b, 42)
@@ -0,0 +1,88 @@
+"""Tests for the Luce choice model service."""
+import random
+
+import pytest
+
+from app.ml import Problem
+from app.ml.beta_utils import beta_mixture_approx
+from app.ml.luce_service import LuceMLService, LuceState
+
+
+def reference_pair_stats(service, problem_type_id, state):
+    """Score synthetic 2-choice problems for every pair in both directions."""
+    n = state.n_classes
+    result = {}
+    for i in range(1, n + 1):
+        for j in range(i + 1, n + 1):
+            betas = [
+                service.get_success_distribution(
+                    Problem(
+                        problem_type_id=problem_type_id,
+                        word_id=0,
+                        vietnamese="",
+                        correct_index=0,
+                        correct_sequence=[correct],
+                        alternatives=[[i], [j]],
+                    ),
+                    state,
+                )
+                for correct in (i, j)
+            ]
+            result[(i, j)] = beta_mixture_approx(
+                betas[0].alpha, betas[0].beta, betas[1].alpha, betas[1].beta, w1=0.5
+            )
+    return result
+
+
+class TestPairStats:
+    """get_all_pair_stats must match scoring each pair problem separately."""
+
+    @pytest.mark.parametrize("prior", [0.5, 1.0, 2.0])
+    def test_matches_reference(self, prior):
+        service = LuceMLService(prior=prior)
+        rng = random.Random(0)
+        for max_count in (0, 3, 50):
+            for _ in range(20):
+                counts = [[float(rng.randint(0, max_count)) for _ in range(6)] for _ in range(6)]
+                state = LuceState(n_classes=6, counts=counts, prior=prior)
+
+                stats = service.get_all_pair_stats("tone_1", state)
+                expected = reference_pair_stats(service, "tone_1", state)
+
+                assert list(stats) == list(expected)
+                for pair, (alpha, beta) in expected.items():
+                    assert stats[pair].alpha == alpha
+                    assert stats[pair].beta == beta
+
+    def test_memoized_until_counts_change(self):
+        service = LuceMLService()
+        state = service.get_initial_state("tone_1")
+
+        stats = service.get_all_pair_stats("tone_1", state)
+        assert service.get_all_pair_stats("tone_1", state) is stats
+
+        updated = state.copy_with_increment(1, 2)
+        updated_stats = service.get_all_pair_stats("tone_1", updated)
+        assert updated_stats is not stats
+        assert updated_stats[(1, 2)].mean < stats[(1, 2)].mean
+        assert service.get_all_pair_stats("tone_1", state) is stats
+
+
+class TestStateEquality:
+    """Cached values on a state must not affect equality."""
+
+    def test_equal_after_counts_array(self):
+        state = LuceState(n_classes=6, counts=[[1.0] * 6 for _ in range(6)])
+        other = LuceState(n_classes=6, counts=[[1.0] * 6 for _ in range(6)])
+        state.counts_array()
+        assert state == other
+        other.counts_array()
+        assert state == other
+        assert state != state.copy_with_increment(1, 2)
+
+    def test_equal_after_pair_stats_memoized(self):
+        service = LuceMLService()
+        state = service.get_initial_state("tone_1")
+        other = service.get_initial_state("tone_1")
+        service.get_all_pair_stats("tone_1", state)
+        assert state == other
@@ -0,0 +1,232 @@
+"""Tests for state persistence and the background state write batcher."""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+
+from app.ml import get_ml_service
+from app.models.progress import UserState
+from app.services import state_persistence
+from app.services.state_persistence import (
+    StateWriteBatcher,
+    delete_state,
+    load_all_states,
+    load_state,
+    load_states,
+    queue_state,
+    save_state,
+)
+
+USER = "user-1"
+
+
+@pytest.fixture
+async def session_maker(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+async def writer(session_maker, monkeypatch):
+    # Long interval: tests flush explicitly unless they drive _run themselves
+    writer = StateWriteBatcher(interval=60, session_maker=session_maker)
+    monkeypatch.setattr(state_persistence, "state_writer", writer)
+    yield writer
+    await writer.close()
+
+
+def make_state(n_answers):
+    """tone_1 state after n_answers confusions of tone 1 with tone 2."""
+    state = get_ml_service().get_initial_state("tone_1")
+    for _ in range(n_answers):
+        state = state.copy_with_increment(1, 2)
+    return state
+
+
+async def stored_rows(session_maker):
+    """All stored rows as {(user_id, problem_type_id): counts}."""
+    async with session_maker() as session:
+        result = await session.execute(
+            select(UserState.user_id, UserState.problem_type_id, UserState.state_json)
+        )
+        return {(uid, ptid): state_json["counts"] for uid, ptid, state_json in result}
+
+
+def block_upserts(monkeypatch, fail=False):
+    """Make the first _upsert_states wait for the returned event (then write or fail).
+
+    Later calls write straight away.
+    """
+    release = asyncio.Event()
+    started = asyncio.Event()
+    upsert = state_persistence._upsert_states
+
+    async def blocked(session, states):
+        if started.is_set():
+            return await upsert(session, states)
+        started.set()
+        await release.wait()
+        if fail:
+            raise ConnectionError("database is down")
+        await upsert(session, states)
+
+    monkeypatch.setattr(state_persistence, "_upsert_states", blocked)
+    return started, release
+
+
+class TestQueue:
+    async def test_saves_coalesce_into_one_write(self, writer, session_maker):
+        for n in range(1, 4):
+            queue_state(USER, "tone_1", make_state(n))
+        queue_state(USER, "tone_2", get_ml_service().get_initial_state("tone_2"))
+        await writer.flush()
+
+        rows = await stored_rows(session_maker)
+        assert set(rows) == {(USER, "tone_1"), (USER, "tone_2")}
+        assert rows[(USER, "tone_1")] == make_state(3).counts
+        assert writer.get(USER, "tone_1") is None
+
+    async def test_loads_see_unwritten_states(self, writer, session_maker):
+        async with session_maker() as session:
+            await save_state(session, USER, "tone_1", make_state(1))
+            queued = make_state(2)
+            queue_state(USER, "tone_1", queued)
+
+            assert await load_state(session, USER, "tone_1") is queued
+            states = await load_states(session, USER, ["tone_1", "tone_2"])
+            assert states["tone_1"] is queued
+            assert states["tone_2"].counts == get_ml_service().get_initial_state("tone_2").counts
+            assert (await load_all_states(session, USER))["tone_1"] is queued
+
+    async def test_loads_see_in_flight_states(self, writer, session_maker, monkeypatch):
+        started, release = block_upserts(monkeypatch)
+        queued = make_state(2)
+        queue_state(USER, "tone_1", queued)
+        flush = asyncio.create_task(writer.flush())
+        await started.wait()
+
+        async with session_maker() as session:
+            assert await load_state(session, USER, "tone_1") is queued
+            assert (await load_all_states(session, USER))["tone_1"] is queued
+
+        release.set()
+        await flush
+        assert (await stored_rows(session_maker))[(USER, "tone_1")] == queued.counts
+
+    async def test_close_flushes_queued_states(self, writer, session_maker):
+        queue_state(USER, "tone_1", make_state(1))
+        await writer.close()
+        assert writer._task is None
+        assert (await stored_rows(session_maker))[(USER, "tone_1")] == make_state(1).counts
+
+    async def test_close_during_flush_writes_the_batch(self, writer, session_maker, monkeypatch):
+        started, release = block_upserts(monkeypatch)
+        writer.interval = 0.01
+        queue_state(USER, "tone_1", make_state(1))
+        await started.wait()  # _run is inside flush
+
+        await writer.close()
+        assert (await stored_rows(session_maker))[(USER, "tone_1")] == make_state(1).counts
+
+    @pytest.mark.parametrize("load", ["load_states", "load_all_states"])
+    async def test_loads_see_states_flushed_during_the_query(
+        self, writer, session_maker, load
+    ):
+        queued = make_state(2)
+        queue_state(USER, "tone_1", queued)
+
+        async with session_maker() as session:
+            execute = session.execute
+
+            async def execute_then_flush(*args, **kwargs):
+                # The query has read the (missing) row; the flush lands before it returns
+                result = await execute(*args, **kwargs)
+                await writer.flush()
+                return result
+
+            session.execute = execute_then_flush
+            if load == "load_states":
+                states = await load_states(session, USER, ["tone_1"])
+            else:
+                states = await load_all_states(session, USER)
+
+        assert states["tone_1"] is queued
+
+    async def test_large_batches_are_written_in_chunks(
+        self, writer, session_maker, monkeypatch
+    ):
+        monkeypatch.setattr(state_persistence, "STATE_UPSERT_CHUNK_SIZE", 2)
+        for i in range(5):
+            queue_state(f"user-{i}", "tone_1", make_state(i))
+        await writer.flush()
+
+        rows = await stored_rows(session_maker)
+        assert rows == {(f"user-{i}", "tone_1"): make_state(i).counts for i in range(5)}
+
+    async def test_delete_drops_queued_state(self, writer, session_maker):
+        queue_state(USER, "tone_1", make_state(1))
+        async with session_maker() as session:
+            assert await delete_state(session, USER, "tone_1")
+            assert not await delete_state(session, USER, "tone_1")
+        await writer.flush()
+        assert (USER, "tone_1") not in await stored_rows(session_maker)
+
+
+class TestFailures:
+    async def test_failed_flush_keeps_newest_state_queued(self, writer, monkeypatch):
+        started, release = block_upserts(monkeypatch, fail=True)
+        queue_state(USER, "tone_1", make_state(1))
+        flush = asyncio.create_task(writer.flush())
+        await started.wait()
+
+        # Queued while the failing write is in flight: must not be overwritten
+        newer = make_state(2)
+        queue_state(USER, "tone_1", newer)
+        release.set()
+        with pytest.raises(ConnectionError):
+            await flush
+        assert writer.get(USER, "tone_1") is newer
+
+    async def test_retries_back_off_then_drop(self, writer, monkeypatch, caplog):
+        attempts = []
+
+        async def failing(session, states):
+            attempts.append(asyncio.get_running_loop().time())
+            raise ConnectionError("database is down")
+
+        monkeypatch.setattr(state_persistence, "_upsert_states", failing)
+        monkeypatch.setattr(state_persistence, "STATE_FLUSH_MAX_RETRIES", 4)
+        writer.interval = 0.01
+        queue_state(USER, "tone_1", make_state(1))
+        await writer._task
+
+        assert len(attempts) == 4
+        gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+        assert gaps == sorted(gaps)
+        assert writer.get(USER, "tone_1") is None
+        # One traceback for the first failure and one for the drop
+        assert sum(r.exc_info is not None for r in caplog.records) == 2
+
+    async def test_direct_save_is_not_overwritten_by_in_flight_batch(
+        self, writer, session_maker, monkeypatch
+    ):
+        started, release = block_upserts(monkeypatch)
+        queue_state(USER, "tone_1", make_state(1))
+        flush = asyncio.create_task(writer.flush())
+        await started.wait()
+
+        newer = make_state(2)
+        async with session_maker() as session:
+            save = asyncio.create_task(save_state(session, USER, "tone_1", newer))
+            await asyncio.sleep(0.01)
+            saved_before_batch = save.done()
+            release.set()
+            await asyncio.gather(flush, save)
+
+        assert not saved_before_batch  # Waits for the in-flight batch
+        assert (await stored_rows(session_maker))[(USER, "tone_1")] == newer.counts